@@ -1,62 +1,87 @@
 import logging
 
 from app.schemas import InvoiceConfidence, InvoiceFields, InvoiceValidation
+from app.validator import AMOUNT_MISMATCH_ISSUE, INVOICE_NUMBER_MISSING, SUPPLIER_NAME_MISSING
 
 logger = logging.getLogger(__name__)
 
+_PRESENT = 0.6
+_ABSENT = 0.2
+
 
 def _clamp(value: float) -> float:
     """Clamp confidence values to [0.0, 1.0]."""
     return max(0.0, min(1.0, value))
 
 
-def compute_confidence(fields: InvoiceFields, validation: InvoiceValidation) -> InvoiceConfidence:
-    """Compute simple, interpretable confidence scores per field."""
-
-    def baseline(present: bool) -> float:
-        return 0.6 if present else 0.2
-
-    supplier_present = bool(fields.supplierName)
-    invoice_present = bool(fields.invoiceNumber)
-    total_present = fields.totalAmount is not None
-
-    supplier_conf = baseline(supplier_present)
-    invoice_conf = baseline(invoice_present)
-    total_conf = baseline(total_present)
+def _score_core(
+    supplier_present: bool,
+    invoice_present: bool,
+    total_present: bool,
+    supplier_is_digit: bool,
+    invoice_has_letters: bool,
+    invoice_has_digits: bool,
+    has_math_issue: bool,
+    missing_invoice: bool,
+    missing_supplier: bool,
+) -> tuple[float, float, float]:
+    """Score pre-computed flags; returns (supplier, invoice, total) confidence."""
+    supplier_conf = _PRESENT if supplier_present else _ABSENT
+    invoice_conf = _PRESENT if invoice_present else _ABSENT
+    total_conf = _PRESENT if total_present else _ABSENT
 
     # Supplier name heuristics: non-numeric, some length
-    if supplier_present and not fields.supplierName.isdigit():
+    if supplier_present and not supplier_is_digit:
         supplier_conf += 0.1
 
     # Invoice number heuristics: mix of letters + digits
-    if invoice_present and fields.invoiceNumber:
-        has_letters = any(c.isalpha() for c in fields.invoiceNumber)
-        has_digits = any(c.isdigit() for c in fields.invoiceNumber)
-        if has_letters and has_digits:
-            invoice_conf += 0.1
+    if invoice_present and invoice_has_letters and invoice_has_digits:
+        invoice_conf += 0.1
 
     # Validation-based adjustments
-    has_math_issue = any(
-        "netAmount + vatAmount does not equal totalAmount" in issue for issue in validation.issues
-    )
-    if total_present and not has_math_issue:
-        total_conf += 0.2
     if has_math_issue:
         total_conf -= 0.3
+    elif total_present:
+        total_conf += 0.2
 
     # Penalize missing key fields
-    if "Invoice number missing" in validation.issues:
+    if missing_invoice:
         invoice_conf -= 0.2
-    if "Supplier name missing" in validation.issues:
+    if missing_supplier:
         supplier_conf -= 0.2
 
-    supplier_conf = _clamp(supplier_conf)
-    invoice_conf = _clamp(invoice_conf)
-    total_conf = _clamp(total_conf)
+    return _clamp(supplier_conf), _clamp(invoice_conf), _clamp(total_conf)
+
+
+def compute_confidence(fields: InvoiceFields, validation: InvoiceValidation) -> InvoiceConfidence:
+    """Compute simple, interpretable confidence scores per field."""
+    supplier_name = fields.supplierName
+    invoice_number = fields.invoiceNumber
+    issues = validation.issues
+    issue_set = frozenset(issues)
+
+    invoice_has_letters = invoice_has_digits = False
+    if invoice_number:
+        # map() over the str methods avoids a Python frame per character; all-digit
+        # numbers (the usual Bulgarian format) rule out letters with one C-level call
+        invoice_has_digits = any(map(str.isdigit, invoice_number))
+        invoice_has_letters = not invoice_number.isdigit() and any(map(str.isalpha, invoice_number))
+
+    supplier_conf, invoice_conf, total_conf = _score_core(
+        supplier_present=bool(supplier_name),
+        invoice_present=bool(invoice_number),
+        total_present=fields.totalAmount is not None,
+        supplier_is_digit=bool(supplier_name) and supplier_name.isdigit(),
+        invoice_has_letters=invoice_has_letters,
+        invoice_has_digits=invoice_has_digits,
+        # The mismatch message carries the difference, so match on its fixed prefix
+        has_math_issue=any(issue.startswith(AMOUNT_MISMATCH_ISSUE) for issue in issues),
+        missing_invoice=INVOICE_NUMBER_MISSING in issue_set,
+        missing_supplier=SUPPLIER_NAME_MISSING in issue_set,
+    )
 
     return InvoiceConfidence(
         supplierName=supplier_conf,
         invoiceNumber=invoice_conf,
         totalAmount=total_conf,
     )
-
@@ -1,17 +1,67 @@
 import asyncio
-import base64
+import functools
+import importlib.util
 import io
 import json
 import logging
 import os
-from typing import Protocol, runtime_checkable
+import re
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Protocol, TypeVar, runtime_checkable
 
-from PIL import Image
+from PIL import Image, ImageOps
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    # SIMD-accelerated; returns str directly, without an intermediate bytes object
+    from pybase64 import b64encode_as_string
+except ImportError:  # pragma: no cover - optional speedup
+    import base64
+
+    def b64encode_as_string(s: bytes) -> str:
+        return base64.b64encode(s).decode("ascii")
+
+from app.llm_cache import LLMCache
 from app.schemas import AdditionalFieldItem, ExtractResponse, InvoiceFields, VisionExtractResponse
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _json_dumps(obj: object) -> str:
+    """Serialize obj to a JSON str (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj)
+
+# Upper bound on in-flight LLM extraction requests across the process (rate-limit control)
+OPENAI_CONCURRENCY = int(os.environ.get("OPENAI_CONCURRENCY", "8"))
+# One semaphore per event loop: a Semaphore binds to the first loop that waits on it,
+# and batch scripts may call asyncio.run() more than once
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# Longest side (px) of page images sent to the vision model
+VISION_MAX_DIM = int(os.environ.get("VISION_MAX_DIM", "2048"))
+VISION_JPEG_QUALITY = int(os.environ.get("VISION_JPEG_QUALITY", "85"))
+
+# Raw LLM responses for repeated extractions; LLM_CACHE_SIZE=0 disables
+_response_cache = LLMCache(int(os.environ.get("LLM_CACHE_SIZE", "256")))
+
+_SYSTEM_PROMPT = (
+    "You are an invoice extraction engine. "
+    "Follow the user's instructions exactly and return ONLY valid JSON."
+)
+
 
 @runtime_checkable
 class LLMClient(Protocol):
@@ -22,6 +72,40 @@ class LLMClient(Protocol):
         ...
 
 
+class _JsonEndTracker:
+    """Track brace depth over streamed text to spot where the top-level JSON object ends.
+
+    Braces inside string literals (e.g. a supplier name) are ignored.
+    """
+
+    __slots__ = ("depth", "in_string", "escaped")
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk: str) -> int:
+        """Consume chunk; return the index of the closing brace in it, or -1 if not closed yet."""
+        for i, ch in enumerate(chunk):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i
+        return -1
+
+
 class DummyLLMClient:
     """Fallback LLM client used when no real provider is configured.
 
@@ -29,28 +113,24 @@ class DummyLLMClient:
     while allowing the service to run self-hosted without an LLM.
     """
 
+    # Every InvoiceFields key set to null, serialized once at import
+    _EMPTY_JSON = _json_dumps(dict.fromkeys(InvoiceFields.model_fields))
+
     async def extract_invoice_json(self, prompt: str) -> str:
         logger.warning("DummyLLMClient in use; returning empty invoice fields")
-        payload = {
-            "supplierName": None,
-            "supplierVat": None,
-            "invoiceNumber": None,
-            "invoiceDate": None,
-            "currency": None,
-            "netAmount": None,
-            "vatAmount": None,
-            "totalAmount": None,
-        }
-        return json.dumps(payload)
+        return self._EMPTY_JSON
 
 
 class OpenAILLMClient:
     """OpenAI-based LLM client for invoice extraction.
 
-    Uses the official OpenAI Python SDK. Configuration via env vars:
+    Uses the official OpenAI Python SDK (async client, so calls never tie up a
+    worker thread). Configuration via env vars:
     - OPENAI_API_KEY: required API key.
     - OPENAI_MODEL: optional model for text (default: gpt-4.1-mini).
     - OPENAI_VISION_MODEL: optional model for vision (default: gpt-5.2).
+    - OPENAI_VISION_UPLOAD: "inline" (default) sends pages as base64 data URIs;
+      "files" uploads them via the Files API and references them by file_id.
     """
 
     def __init__(self) -> None:
@@ -59,86 +139,140 @@ class OpenAILLMClient:
             raise RuntimeError("OPENAI_API_KEY is not set; cannot use OpenAILLMClient")
 
         try:
-            from openai import OpenAI  # type: ignore
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient  # type: ignore
         except ImportError as exc:  # pragma: no cover - import error path
             raise RuntimeError(
                 "openai package is not installed. "
                 "Install it with 'pip install openai' inside the ocr-service env."
             ) from exc
 
-        self._client = OpenAI(api_key=api_key)
+        # One pooled client for the process: keep-alive connections skip TLS handshakes across
+        # extractions; HTTP/2 (when h2 is installed) multiplexes concurrent requests
+        http_client = DefaultAsyncHttpxClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        )
+        self._client = AsyncOpenAI(api_key=api_key, http_client=http_client)
         self._model = os.environ.get("OPENAI_MODEL", "gpt-4.1-mini")
         self._vision_model = os.environ.get("OPENAI_VISION_MODEL", "gpt-5.2")
+        self._vision_upload = os.environ.get("OPENAI_VISION_UPLOAD", "inline").lower()
         logger.info("Initialized OpenAILLMClient with model %s, vision %s", self._model, self._vision_model)
 
+    async def _complete(self, model: str, user_content: str | list[dict], max_tokens: int) -> str:
+        """Single chat completion shared by the text and vision paths; returns stripped content.
+
+        The response is streamed and reading stops as soon as the top-level JSON
+        object closes, so receiving overlaps generation and trailing tokens are skipped.
+        """
+        stream = await self._client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": _SYSTEM_PROMPT},
+                {"role": "user", "content": user_content},
+            ],
+            temperature=0.0,
+            max_completion_tokens=max_tokens,
+            stream=True,
+        )
+        parts: list[str] = []
+        tracker = _JsonEndTracker()
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                end = tracker.feed(delta)
+                if end >= 0:
+                    parts.append(delta[: end + 1])
+                    break
+                parts.append(delta)
+        return "".join(parts).strip()
+
     async def extract_invoice_json(self, prompt: str) -> str:
         """Call OpenAI chat completion API and return the raw content string."""
-
-        def _call() -> str:
-            # Local import to avoid paying import cost at module import time if unused
-            from openai import OpenAI  # type: ignore  # noqa: F401
-
-            response = self._client.chat.completions.create(
-                model=self._model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an invoice extraction engine. "
-                            "Follow the user's instructions exactly and return ONLY valid JSON."
-                        ),
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.0,
-                max_completion_tokens=512,
-            )
-            content = response.choices[0].message.content or ""
-            return content.strip()
-
-        # Run the blocking OpenAI call in a thread so we don't block the event loop
-        return await asyncio.to_thread(_call)
+        return await self._complete(self._model, prompt, 512)
 
     async def extract_invoice_json_from_images(
         self, image_parts: list[tuple[bytes, str]], prompt: str
     ) -> str:
-        """Call OpenAI vision API: user message with text + image_url parts; return raw JSON string."""
+        """Call OpenAI vision API: user message with text + image parts; return raw JSON string."""
+        logger.info("Extracting invoice fields from images with model %s", self._vision_model)
+        if self._vision_upload == "files":
+            try:
+                return await self._extract_from_uploaded_files(image_parts, prompt)
+            except Exception as exc:
+                logger.warning("Vision file upload failed, falling back to inline base64: %s", exc)
+
         content: list[dict] = [{"type": "text", "text": prompt}]
         for img_bytes, mime in image_parts:
-            b64 = base64.standard_b64encode(img_bytes).decode("ascii")
+            b64 = b64encode_as_string(img_bytes)
             content.append(
                 {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}}
             )
+        return await self._complete(self._vision_model, content, 2048)
 
-        def _call() -> str:
-            from openai import OpenAI  # type: ignore  # noqa: F401
-            logger.info("Extracting invoice fields from images with model %s", self._vision_model)
-            response = self._client.chat.completions.create(
+    async def _extract_from_uploaded_files(
+        self, image_parts: list[tuple[bytes, str]], prompt: str
+    ) -> str:
+        """Upload pages as binary files (no base64 inflation) and reference them by file_id.
+
+        Chat Completions has no file reference for images, so this path uses the Responses API.
+        Uploaded files are deleted once the response is received.
+        """
+        uploaded = await asyncio.gather(
+            *(
+                self._client.files.create(
+                    file=(f"page-{i + 1}.{mime.rsplit('/', 1)[-1]}", img_bytes, mime),
+                    purpose="vision",
+                )
+                for i, (img_bytes, mime) in enumerate(image_parts)
+            ),
+            return_exceptions=True,
+        )
+        file_ids = [f.id for f in uploaded if not isinstance(f, BaseException)]
+        try:
+            failed = next((f for f in uploaded if isinstance(f, BaseException)), None)
+            if failed is not None:
+                raise failed
+            content: list[dict] = [{"type": "input_text", "text": prompt}]
+            content.extend({"type": "input_image", "file_id": file_id} for file_id in file_ids)
+            response = await self._client.responses.create(
                 model=self._vision_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an invoice extraction engine. "
-                            "Follow the user's instructions exactly and return ONLY valid JSON."
-                        ),
-                    },
-                    {"role": "user", "content": content},
-                ],
+                instructions=_SYSTEM_PROMPT,
+                input=[{"role": "user", "content": content}],
                 temperature=0.0,
-                max_completion_tokens=2048,
+                max_output_tokens=2048,
             )
-            raw = response.choices[0].message.content or ""
-            return raw.strip()
+            return (response.output_text or "").strip()
+        finally:
+            await asyncio.gather(
+                *(self._client.files.delete(file_id) for file_id in file_ids),
+                return_exceptions=True,
+            )
+
 
-        return await asyncio.to_thread(_call)
+async def run_many(client: LLMClient, prompts: list[str]) -> list[str]:
+    """
+    Run extract_invoice_json for many prompts so their network waits overlap.
+
+    All requests are submitted before any result is awaited; awaiting each call
+    inline (await in a loop, or future.result() right after submit) would
+    serialize them. Results keep input order and share the OPENAI_CONCURRENCY bound.
+    """
+    tasks = [asyncio.ensure_future(_bounded(client.extract_invoice_json(p))) for p in prompts]
+    return list(await asyncio.gather(*tasks))
 
 
+@functools.lru_cache(maxsize=1)
 def get_llm_client() -> LLMClient:
-    """Factory for LLM client instances.
+    """Factory for the process-wide LLM client.
 
     If OPENAI_API_KEY is set (and optionally LLM_PROVIDER=openai), use OpenAI;
-    otherwise fall back to the dummy implementation.
+    otherwise fall back to the dummy implementation. The instance is cached so
+    its HTTP connection pool is reused across requests; env vars are read once.
     """
     provider = os.environ.get("LLM_PROVIDER") or (
         "openai" if os.environ.get("OPENAI_API_KEY") else "dummy"
@@ -177,6 +311,12 @@ Expected JSON format:
 OCR text:
 \"\"\"{ocr_text}\"\"\""""
 
+# PROMPT_TEMPLATE pre-split around its only placeholder, so building a prompt is two
+# concatenations instead of a str.format pass over the escaped template on every call
+_PROMPT_PREFIX, _PROMPT_SUFFIX = (
+    PROMPT_TEMPLATE.replace("{{", "{").replace("}}", "}").split("{ocr_text}")
+)
+
 VISION_PROMPT = """The following image(s) show an invoice document. Extract the requested fields from the image(s).
 
 Return STRICT JSON only, no explanation or additional text. Use null for missing or unknown values.
@@ -208,33 +348,41 @@ Example overall structure:
 }}"""
 
 
+# Opening ``` fence (with optional language tag) through an optional closing fence
+_FENCE_RE = re.compile(r"\A\s*```[^\n]*\n(.*?)(?:```\s*)?\Z", re.DOTALL)
+
+
 def _strip_markdown_json(raw: str) -> str:
     """If raw is wrapped in ```json ... ``` or ``` ... ```, return the inner content; else return stripped raw."""
-    s = raw.strip()
-    if s.startswith("```"):
-        # Remove opening fence (```json or ```)
-        first_nl = s.find("\n")
-        if first_nl != -1:
-            s = s[first_nl + 1 :]
-        # Remove closing ```
-        if s.rstrip().endswith("```"):
-            s = s[: s.rstrip().rfind("```")].rstrip()
-        return s.strip()
-    return s
+    m = _FENCE_RE.match(raw)
+    return m.group(1).strip() if m else raw.strip()
 
 
-def _pil_to_base64_parts(images: list[Image.Image]) -> list[tuple[bytes, str]]:
-    """Convert PIL images to (bytes, mime) for vision API. Uses PNG."""
-    parts: list[tuple[bytes, str]] = []
+def _encode_image(img: Image.Image) -> tuple[bytes, str]:
+    """Encode one page for the vision API: JPEG, or PNG when the image has alpha.
+
+    Pages larger than VISION_MAX_DIM on their longest side are downscaled first;
+    the model does not use the extra resolution and every byte is base64'd and uploaded.
+    """
+    if max(img.size) > VISION_MAX_DIM:
+        img = ImageOps.contain(img, (VISION_MAX_DIM, VISION_MAX_DIM), Image.Resampling.LANCZOS)
     buf = io.BytesIO()
-    for img in images:
-        buf.seek(0)
-        buf.truncate(0)
-        if getattr(img, "mode", None) != "RGB":
-            img = img.convert("RGB")
+    if img.mode in ("RGBA", "LA"):
         img.save(buf, format="PNG")
-        parts.append((buf.getvalue(), "image/png"))
-    return parts
+        return buf.getvalue(), "image/png"
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    img.save(buf, format="JPEG", quality=VISION_JPEG_QUALITY)
+    return buf.getvalue(), "image/jpeg"
+
+
+def _pil_to_base64_parts(images: list[Image.Image]) -> list[tuple[bytes, str]]:
+    """Convert PIL images to (bytes, mime) for vision API, encoding pages in parallel."""
+    if len(images) <= 1:
+        return [_encode_image(img) for img in images]
+    # Pillow releases the GIL inside libjpeg/libpng, so threads encode pages on separate cores
+    with ThreadPoolExecutor(max_workers=min(len(images), os.cpu_count() or 1)) as pool:
+        return list(pool.map(_encode_image, images))
 
 
 def _parse_vision_response(data: dict) -> VisionExtractResponse:
@@ -259,10 +407,11 @@ def _parse_vision_response(data: dict) -> VisionExtractResponse:
                 )
             except Exception:
                 continue
-        return VisionExtractResponse(requiredFields=required, additionalFields=additional)
+        # Both parts are already validated models; construct the wrapper without re-validating
+        return VisionExtractResponse.model_construct(requiredFields=required, additionalFields=additional)
     # Legacy: whole object is requiredFields
     required = ExtractResponse(**data)
-    return VisionExtractResponse(requiredFields=required, additionalFields=[])
+    return VisionExtractResponse.model_construct(requiredFields=required, additionalFields=[])
 
 
 async def extract_invoice_fields_from_images(
@@ -275,17 +424,26 @@ async def extract_invoice_fields_from_images(
     """
     if not images:
         return VisionExtractResponse(requiredFields=ExtractResponse(), additionalFields=[])
-    image_parts = _pil_to_base64_parts(images)
+    # Resize + JPEG encode is CPU-bound (~100ms+ per large page); keep it off the event loop
+    image_parts = await asyncio.to_thread(_pil_to_base64_parts, images)
     prompt = VISION_PROMPT
     client = get_llm_client()
     method = getattr(client, "extract_invoice_json_from_images", None)
     if method is None:
         raise RuntimeError("Vision extraction requires OpenAI (set OPENAI_API_KEY).")
+    # Exact key over the encoded image bytes; re-uploads of the same scan skip the API call
+    cache_key = LLMCache.key("vision", prompt, *(img_bytes for img_bytes, _ in image_parts))
     try:
-        raw = await method(image_parts, prompt)
+        raw = _response_cache.get(cache_key)
+        if raw is None:
+            # One multi-image call per document; the slot is shared with every other
+            # in-flight request, so concurrent /extract-vision uploads are capped too
+            raw = await _bounded(method(image_parts, prompt))
         parsed = _strip_markdown_json(raw)
-        data = json.loads(parsed)
-        return _parse_vision_response(data)
+        data = _json_loads(parsed)
+        result = _parse_vision_response(data)
+        _response_cache.set(cache_key, raw)
+        return result
     except Exception as exc:
         logger.exception("Vision extraction failed: %s", exc)
         raise
@@ -294,13 +452,54 @@ async def extract_invoice_fields_from_images(
 async def extract_invoice_fields(ocr_text: str) -> InvoiceFields:
     """Call the configured LLM to extract structured invoice fields from OCR text."""
     client = get_llm_client()
-    prompt = PROMPT_TEMPLATE.format(ocr_text=ocr_text)
+    prompt = _PROMPT_PREFIX + ocr_text + _PROMPT_SUFFIX
+    # Whitespace-insensitive key so retries/reprocesses of the same OCR text hit the cache
+    cache_key = LLMCache.key("text", " ".join(ocr_text.split()))
     try:
-        raw = await client.extract_invoice_json(prompt)
-        data = json.loads(raw)
-        return InvoiceFields(**data)
+        raw = _response_cache.get(cache_key)
+        if raw is None:
+            raw = await _bounded(client.extract_invoice_json(prompt))
+        # Parse + validate in one pydantic-core pass; LLM output is untrusted, so no model_construct
+        fields = InvoiceFields.model_validate_json(raw)
+        _response_cache.set(cache_key, raw)
+        return fields
     except Exception as exc:  # pragma: no cover - defensive fallback
         logger.exception("LLM extraction failed; returning empty fields: %s", exc)
         # Fallback to an all-null structure to keep response deterministic
         return InvoiceFields()
 
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    """The running loop's OPENAI_CONCURRENCY semaphore, created on first use."""
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _llm_semaphores[loop] = asyncio.Semaphore(max(1, OPENAI_CONCURRENCY))
+    return semaphore
+
+
+async def _bounded(coro: Awaitable[T]) -> T:
+    """Await coro while holding a slot of the shared LLM semaphore (bounds all API calls)."""
+    async with _llm_semaphore():
+        return await coro
+
+
+async def extract_invoice_fields_batch(texts: list[str]) -> list[InvoiceFields]:
+    """
+    Extract invoice fields for many OCR texts concurrently.
+    Results are returned in input order; at most OPENAI_CONCURRENCY requests are in flight.
+    """
+    return list(await asyncio.gather(*(extract_invoice_fields(t) for t in texts)))
+
+
+async def extract_invoice_fields_from_images_batch(
+    pages_per_doc: list[list[Image.Image]],
+) -> list[VisionExtractResponse]:
+    """
+    Extract invoice fields for several documents concurrently.
+    Each document's pages go into a single multi-image vision call; documents are
+    fanned out under the shared OPENAI_CONCURRENCY bound. Results keep input order.
+    """
+    return list(
+        await asyncio.gather(*(extract_invoice_fields_from_images(pages) for pages in pages_per_doc))
+    )
@@ -0,0 +1,80 @@
+"""In-memory cache of raw LLM responses keyed by a content hash."""
+
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sampling above this temperature is meant to vary; such requests are never cached
+MAX_CACHEABLE_TEMPERATURE = 0.3
+
+
+class LLMCache:
+    """
+    Bounded LRU mapping content hashes to raw LLM response strings.
+
+    Keys are exact (SHA-256), not semantic: two invoices from the same supplier
+    are near-identical text with different numbers, so a similarity match would
+    return another invoice's fields. max_entries <= 0 disables the cache.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts: str | bytes) -> str:
+        """Hash the given parts (str or bytes) into a cache key."""
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(part.encode("utf-8") if isinstance(part, str) else part)
+            h.update(b"\0")
+        return h.hexdigest()
+
+    @classmethod
+    def request_key(
+        cls, model: str, messages: list[dict[str, Any]], temperature: float
+    ) -> Optional[str]:
+        """Key for a chat request, or None when temperature is too high to cache."""
+        if temperature > MAX_CACHEABLE_TEMPERATURE:
+            return None
+        payload = json.dumps([model, messages, temperature], sort_keys=True, ensure_ascii=False)
+        return cls.key("chat", payload)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on miss."""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        logger.debug("LLM cache hit %s (hits=%d, misses=%d)", key[:12], self.hits, self.misses)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """Store value under key, evicting the least recently used entry when full."""
+        if self._max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_set(self, key: Optional[str], factory: Callable[[], Awaitable[str]]) -> str:
+        """Return the cached value for key, or await factory() and cache its result.
+
+        key=None (uncacheable request) always calls factory.
+        """
+        if key is None:
+            return await factory()
+        value = self.get(key)
+        if value is None:
+            value = await factory()
+            self.set(key, value)
+        return value
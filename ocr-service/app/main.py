@@ -8,21 +8,40 @@ from dotenv import load_dotenv
 load_dotenv(Path(__file__).resolve().parent.parent / ".env")
 
 import asyncio
+import atexit
+import functools
 import io
 import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import tempfile
 import uuid
-from typing import Any
-
-from fastapi import FastAPI, File, HTTPException, UploadFile
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Iterator
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+from fastapi import FastAPI, File, HTTPException, Response, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+import numpy as np
+from openai import AsyncOpenAI
 from PIL import Image
 from pydantic import BaseModel
 
 from app.confidence import compute_confidence
-from app.extractor import extract_invoice_fields, extract_invoice_fields_from_images
-from app.pdf_utils import pdf_to_images
+from app.extractor import (
+    VISION_MAX_DIM,
+    extract_invoice_fields,
+    extract_invoice_fields_from_images,
+    get_llm_client,
+)
+from app.llm_cache import LLMCache
+from app.pdf_utils import iter_pdf_arrays, pdf_to_images, warm_render_pool
 from app.rule_extractor import extract_invoice_rules
 from app.schemas import (
     ExtractInvoiceRequest,
@@ -31,23 +50,88 @@ from app.schemas import (
     ExtractResponse,
     VisionExtractResponse,
 )
-from app.ocr import extract_text_from_image
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
+from app.ocr import (
+    OCR_GRAYSCALE,
+    OCR_MAX_EDGE,
+    extract_text_from_image,
+    extract_text_from_images,
+    init_engine,
 )
-# Ensure app loggers emit INFO even if uvicorn overrides root logger level
-logging.getLogger("app").setLevel(logging.INFO)
+from app.ocr_cache import OCRCache
+from app.validator import validate_invoice
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+# Handlers only enqueue records; a listener thread does the (possibly slow) stderr
+# writes, so request handlers never block on log I/O
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s - %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+_log_queue_handler = logging.handlers.QueueHandler(_log_queue)
+# prepare() pre-renders the message (and traceback); keep it bare so the listener's
+# formatter adds the timestamp/level prefix exactly once
+_log_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.basicConfig(level=LOG_LEVEL, handlers=[_log_queue_handler])
+# Ensure app loggers emit at LOG_LEVEL even if uvicorn overrides root logger level
+logging.getLogger("app").setLevel(LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# Load PaddleOCR at startup (per worker process); set OCR_WARMUP=0 to defer to the first /ocr request
+OCR_WARMUP = os.environ.get("OCR_WARMUP", "1").lower() not in ("0", "false", "no")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_chat_client(api_key: str) -> AsyncOpenAI:
+    """Process-wide OpenAI client for invoice chat; reuses its connection pool across requests."""
+    return AsyncOpenAI(api_key=api_key)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """Warm the OCR engine and OpenAI clients before the first request arrives."""
+    if OCR_WARMUP:
+        try:
+            await asyncio.to_thread(init_engine)
+        except Exception:
+            # Keep serving; the engine is loaded lazily on the first /ocr request instead
+            logger.exception("OCR engine warm-up failed")
+    await asyncio.to_thread(_ocr_cache.prune)
+    try:
+        await asyncio.to_thread(warm_render_pool)
+    except Exception:
+        # Rendering falls back to starting the pool on the first heavy PDF
+        logger.exception("PDF render pool warm-up failed")
+    try:
+        get_llm_client()
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if api_key:
+            _get_chat_client(api_key)
+    except Exception:
+        # e.g. LLM_PROVIDER=openai without a key: only the LLM endpoints should fail
+        logger.exception("LLM client warm-up failed")
+    yield
+
+
 app = FastAPI(
     title="OCR Service",
     description="Extract plain text from PDF and image documents",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg"}
+ALLOWED_EXTENSIONS = frozenset({".pdf", ".png", ".jpg", ".jpeg"})
+
+# Pages OCR'd at once across all requests; bounds default threadpool usage
+OCR_MAX_PARALLEL_PAGES = int(os.environ.get("OCR_MAX_PARALLEL_PAGES", "4"))
+_ocr_semaphore = asyncio.Semaphore(max(1, OCR_MAX_PARALLEL_PAGES))
+# PDF pages handed to the OCR engine per call in /ocr (PaddleOCR 3.x batches them)
+OCR_BATCH_PAGES = max(1, int(os.environ.get("OCR_BATCH_PAGES", "1")))
+# Per request, OCR tasks (pages or batches) rendered but not yet finished before the
+# next page is rendered; keeps rendering from running ahead of OCR and holding every page
+_OCR_RENDER_AHEAD = max(1, OCR_MAX_PARALLEL_PAGES)
 
 
 class PageResult(BaseModel):
@@ -65,16 +149,160 @@ class OCRResponse(BaseModel):
 
 
 def _get_file_extension(filename: str | None) -> str:
-    """Extract lowercase extension from filename."""
-    if not filename or "." not in filename:
-        return ""
-    return "." + filename.rsplit(".", 1)[-1].lower()
+    """Lowercase extension (with dot) from the filename, or "" if none."""
+    return os.path.splitext(filename or "")[1].lower()
+
+
+# Opt-in disk cache of OCR page texts for re-uploaded files; unset OCR_CACHE_DIR disables
+_ocr_cache = OCRCache(
+    os.environ.get("OCR_CACHE_DIR") or None,
+    int(os.environ.get("OCR_CACHE_MAX_ENTRIES", "10000")),
+)
+
+# Larger uploads are rejected with 413 before their body is read
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "50"))
+
+
+def _reqid() -> str:
+    """Short request id for log correlation (not a security token, so no CSPRNG)."""
+    return f"{random.getrandbits(32):08x}"
+
+
+def _check_upload_size(file: UploadFile) -> None:
+    """Reject empty or oversized uploads from the size Starlette recorded, before reading them."""
+    if file.size is None:
+        return
+    if file.size == 0:
+        raise HTTPException(status_code=400, detail="Empty file")
+    if file.size > MAX_UPLOAD_MB << 20:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size: {MAX_UPLOAD_MB} MB")
+
+
+# Uploads up to this size stay in memory; larger ones are spooled to a temp file
+UPLOAD_SPOOL_THRESHOLD_MB = int(os.environ.get("UPLOAD_SPOOL_THRESHOLD_MB", "8"))
+_UPLOAD_CHUNK = 1 << 20
 
 
-def _is_allowed_file(filename: str | None, content_type: str | None) -> bool:
-    """Check if file type is supported (validates extension; content_type is advisory)."""
-    ext = _get_file_extension(filename)
-    return ext in ALLOWED_EXTENSIONS
+async def _materialize_upload(file: UploadFile, suffix: str) -> tuple[bytes | None, str | None]:
+    """
+    Read an upload in 1 MB chunks. Returns (bytes, None) for uploads up to
+    UPLOAD_SPOOL_THRESHOLD_MB, else (None, path) of a temp file the caller must unlink.
+    Returns (b"", None) for an empty upload.
+    """
+    threshold = UPLOAD_SPOOL_THRESHOLD_MB << 20
+    buf = bytearray()
+    tmp = None
+    try:
+        while chunk := await file.read(_UPLOAD_CHUNK):
+            if tmp is not None:
+                await asyncio.to_thread(tmp.write, chunk)
+                continue
+            buf += chunk
+            if len(buf) > threshold:
+                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+                await asyncio.to_thread(tmp.write, buf)
+                buf = bytearray()
+    except BaseException:
+        if tmp is not None:
+            tmp.close()
+            os.unlink(tmp.name)
+        raise
+    if tmp is None:
+        return bytes(buf), None
+    tmp.close()
+    return None, tmp.name
+
+
+def _open_rgb(source: bytes | str, max_dim: int | None = None) -> Image.Image:
+    """
+    Open an image from bytes or a file path and return it as a loaded RGB image.
+
+    When max_dim is given and a JPEG is larger, draft() has libjpeg decode at the
+    largest 1/2, 1/4 or 1/8 scale that still covers max_dim on the longest side.
+    """
+    img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    if max_dim is not None and max(img.size) > max_dim:
+        # Request the aspect-preserving target size; draft() never goes below it
+        ratio = max_dim / max(img.size)
+        img.draft("RGB", (max(1, int(img.width * ratio)), max(1, int(img.height * ratio))))
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    img.load()
+    return img
+
+
+async def _ocr_page(img: Image.Image | np.ndarray) -> str:
+    """Run blocking OCR for one page in a worker thread, bounded by OCR_MAX_PARALLEL_PAGES."""
+    async with _ocr_semaphore:
+        return await asyncio.to_thread(extract_text_from_image, img)
+
+
+async def _ocr_batch(images: list[Image.Image | np.ndarray]) -> list[str]:
+    """OCR a batch of pages in one engine call in a worker thread; holds one OCR slot."""
+    async with _ocr_semaphore:
+        return await asyncio.to_thread(extract_text_from_images, images)
+
+
+def _close_page_iter(page_iter: Iterator[Any], render: asyncio.Future[Any] | None) -> None:
+    """
+    Close a page iterator, deferring until an in-flight to_thread(next, page_iter) render
+    returns: closing a generator while a worker thread is inside it raises ValueError.
+    """
+    if render is not None and not render.done():
+        render.add_done_callback(lambda _: page_iter.close())
+    else:
+        page_iter.close()
+
+
+async def _ocr_document(source: bytes | str, ext: str, request_id: str) -> list[str]:
+    """OCR every page of an upload (PDF or single image); returns page texts in order."""
+    if ext != ".pdf":
+        text = await _ocr_page(_open_rgb(source, max_dim=OCR_MAX_EDGE or None))
+        logger.info("[%s] Image processed", request_id)
+        return [text]
+
+    # Render pages one at a time in a worker thread and start OCR on each batch of
+    # OCR_BATCH_PAGES as soon as it is ready; gather keeps page order. At most
+    # _OCR_RENDER_AHEAD batches are in flight before the next page is rendered.
+    # The thread only keeps file I/O and parsing off the loop: PyMuPDF holds the GIL
+    # while rasterizing, so a heavy in-process page still stalls the event loop
+    # (pages handed to the PDF_RENDER_WORKERS process pool do not).
+    page_iter = iter_pdf_arrays(source, grayscale=OCR_GRAYSCALE)
+    tasks: list[asyncio.Future[list[str]]] = []
+    pending: set[asyncio.Future[list[str]]] = set()
+    batch: list[np.ndarray] = []
+    page_count = 0
+    render: asyncio.Future[np.ndarray | None] | None = None
+    try:
+        while True:
+            if not batch and len(pending) >= _OCR_RENDER_AHEAD:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()  # fail fast instead of rendering the rest
+            # shield: a cancelled request must not mark the render done while the
+            # worker thread is still inside the generator (see _close_page_iter)
+            render = asyncio.ensure_future(asyncio.to_thread(next, page_iter, None))
+            img = await asyncio.shield(render)
+            render = None
+            if img is None:
+                break
+            page_count += 1
+            batch.append(img)
+            if len(batch) == OCR_BATCH_PAGES:
+                task = asyncio.ensure_future(_ocr_batch(batch))
+                tasks.append(task)
+                pending.add(task)
+                batch = []
+        if batch:
+            tasks.append(asyncio.ensure_future(_ocr_batch(batch)))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[%s] PDF converted to %d pages", request_id, page_count)
+        return [text for texts in await asyncio.gather(*tasks) for text in texts]
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        _close_page_iter(page_iter, render)
+        raise
 
 
 @app.get("/health")
@@ -83,68 +311,181 @@ async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
-@app.post("/ocr", response_model=OCRResponse)
-async def ocr_extract(file: UploadFile = File(...)) -> OCRResponse:
+async def _receive_ocr_upload(file: UploadFile, request_id: str) -> tuple[str, bytes | str, str | None]:
     """
-    Extract plain text from an uploaded PDF or image file.
-
-    Supports: PDF, PNG, JPG
+    Validate an OCR upload and read it; returns (ext, source, spool_path).
+    source is the bytes or the spooled temp file path; the caller unlinks spool_path.
     """
-    request_id = str(uuid.uuid4())[:8]
-
     if not file.filename:
         logger.warning("[%s] No filename provided", request_id)
         raise HTTPException(status_code=422, detail="No file provided")
 
-    if not _is_allowed_file(file.filename, file.content_type):
+    ext = _get_file_extension(file.filename)
+    if ext not in ALLOWED_EXTENSIONS:
         logger.warning("[%s] Unsupported file type: %s", request_id, file.filename)
         raise HTTPException(
             status_code=400,
             detail=f"Unsupported file type. Allowed: PDF, PNG, JPG",
         )
 
-    content = await file.read()
-    if not content:
+    _check_upload_size(file)
+    content, spool_path = await _materialize_upload(file, ext)
+    if not content and spool_path is None:
         raise HTTPException(status_code=400, detail="Empty file")
+    return ext, (content if spool_path is None else spool_path), spool_path
 
+
+@app.post("/ocr", response_model=OCRResponse)
+async def ocr_extract(file: UploadFile = File(...)) -> OCRResponse:
+    """
+    Extract plain text from an uploaded PDF or image file.
+
+    Supports: PDF, PNG, JPG
+    """
+    request_id = _reqid()
+    ext, source, spool_path = await _receive_ocr_upload(file, request_id)
     document_id = str(uuid.uuid4())
-    ext = _get_file_extension(file.filename)
-    pages: list[PageResult] = []
 
     try:
-        if ext == ".pdf":
-            images = pdf_to_images(content)
-            logger.info("[%s] PDF converted to %d pages", request_id, len(images))
-
-            for i, img in enumerate(images):
-                text = extract_text_from_image(img)
-                pages.append(PageResult(page=i + 1, text=text))
+        cache_key: str | None = None
+        texts: list[str] | None = None
+        if _ocr_cache.enabled:
+            cache_key = await asyncio.to_thread(_ocr_cache.key, source)
+            texts = await asyncio.to_thread(_ocr_cache.get, cache_key)
+        if texts is None:
+            texts = await _ocr_document(source, ext, request_id)
+            if cache_key is not None:
+                await asyncio.to_thread(_ocr_cache.set, cache_key, texts)
         else:
-            img = Image.open(io.BytesIO(content))
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            text = extract_text_from_image(img)
-            pages.append(PageResult(page=1, text=text))
-            logger.info("[%s] Image processed", request_id)
+            logger.info("[%s] OCR cache hit", request_id)
+
+    except (ValueError, RuntimeError, OSError) as e:
+        logger.exception("[%s] OCR processing failed: %s", request_id, e)
+        return JSONResponse(
+            status_code=500,
+            content={"detail": "OCR processing failed", "documentId": document_id},
+        )
+    finally:
+        if spool_path is not None:
+            os.unlink(spool_path)
+
+    # All values are server-generated (uuid, page index, OCR str), so skip validation
+    pages = [PageResult.model_construct(page=i + 1, text=text) for i, text in enumerate(texts)]
+    return OCRResponse.model_construct(documentId=document_id, pages=pages)
+
+
+def _ndjson(obj: dict[str, Any]) -> bytes:
+    """Serialize one NDJSON line."""
+    if orjson is not None:
+        return orjson.dumps(obj) + b"\n"
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+async def _indexed_ocr_page(index: int, img: Image.Image | np.ndarray) -> tuple[int, str]:
+    """OCR one page via _ocr_page and return (index, text), so out-of-order completions keep their page."""
+    return index, await _ocr_page(img)
 
+
+@app.post("/ocr/stream")
+async def ocr_extract_stream(file: UploadFile = File(...)) -> Response:
+    """
+    Like /ocr, but streams NDJSON: a {"documentId"} line, then one {"page", "text"}
+    line per page as soon as that page is OCR'd (pages may arrive out of order).
+
+    Upload and PDF open errors are returned as normal HTTP errors; a failure after
+    streaming has started ends the stream with a {"detail"} line.
+    """
+    request_id = _reqid()
+    ext, source, spool_path = await _receive_ocr_upload(file, request_id)
+    document_id = str(uuid.uuid4())
+
+    cached: list[str] | None = None
+    cache_key: str | None = None
+    page_iter = None
+    first_page: Image.Image | np.ndarray | None = None
+    try:
+        if _ocr_cache.enabled:
+            cache_key = await asyncio.to_thread(_ocr_cache.key, source)
+            cached = await asyncio.to_thread(_ocr_cache.get, cache_key)
+        if cached is None:
+            if ext == ".pdf":
+                # Open and render page 1 up front so a corrupt PDF still gets a 500
+                page_iter = iter_pdf_arrays(source, grayscale=OCR_GRAYSCALE)
+                first_page = await asyncio.to_thread(next, page_iter, None)
+            else:
+                first_page = _open_rgb(source, max_dim=OCR_MAX_EDGE or None)
     except (ValueError, RuntimeError, OSError) as e:
         logger.exception("[%s] OCR processing failed: %s", request_id, e)
+        if spool_path is not None:
+            os.unlink(spool_path)
         return JSONResponse(
             status_code=500,
             content={"detail": "OCR processing failed", "documentId": document_id},
         )
 
-    return OCRResponse(documentId=document_id, pages=pages)
+    async def _stream() -> AsyncIterator[bytes]:
+        tasks: list[asyncio.Future[tuple[int, str]]] = []
+        render: asyncio.Future[Image.Image | np.ndarray | None] | None = None
+        try:
+            yield _ndjson({"documentId": document_id})
+            if cached is not None:
+                logger.info("[%s] OCR cache hit", request_id)
+                for i, text in enumerate(cached):
+                    yield _ndjson({"page": i + 1, "text": text})
+                return
+
+            # Render the next page while earlier pages are OCR'd, and emit each page as
+            # soon as its OCR finishes. A rendered page waits for OCR to start only while
+            # _OCR_RENDER_AHEAD pages are in flight, so rendering never runs further ahead.
+            texts: list[str] = []
+            pending: set[asyncio.Future] = set()
+            img = first_page
+            rendering = page_iter is not None
+            while True:
+                if img is not None and len(pending) < _OCR_RENDER_AHEAD:
+                    texts.append("")
+                    task = asyncio.ensure_future(_indexed_ocr_page(len(texts), img))
+                    tasks.append(task)
+                    pending.add(task)
+                    img = None
+                    if rendering:
+                        render = asyncio.ensure_future(asyncio.to_thread(next, page_iter, None))
+                if not pending and render is None:
+                    break
+                waiting = pending if render is None else pending | {render}
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                if render in done:
+                    img = render.result()
+                    rendering = img is not None
+                    render = None
+                for task in done & pending:
+                    pending.discard(task)
+                    page, text = task.result()
+                    texts[page - 1] = text
+                    yield _ndjson({"page": page, "text": text})
+            if cache_key is not None:
+                await asyncio.to_thread(_ocr_cache.set, cache_key, texts)
+        except (ValueError, RuntimeError, OSError) as e:
+            logger.exception("[%s] OCR processing failed: %s", request_id, e)
+            yield _ndjson({"detail": "OCR processing failed", "documentId": document_id})
+        finally:
+            for task in tasks:
+                task.cancel()
+            if page_iter is not None:
+                _close_page_iter(page_iter, render)
+            if spool_path is not None:
+                os.unlink(spool_path)
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
 
 
 async def _extract_invoice_llm(payload: ExtractInvoiceRequest) -> ExtractInvoiceResponse:
     """Shared LLM-based extraction: fields, validation, confidence. Used by /extract-invoice and /extract-llm."""
-    from app.validator import validate_invoice  # local import to avoid cycles
-
     fields = await extract_invoice_fields(payload.ocrText)
     validation = validate_invoice(fields)
     confidence = compute_confidence(fields, validation)
-    return ExtractInvoiceResponse(
+    # Parts are already-validated models (fields were validated from the LLM JSON)
+    return ExtractInvoiceResponse.model_construct(
         documentId=payload.documentId,
         fields=fields,
         confidence=confidence,
@@ -155,10 +496,11 @@ async def _extract_invoice_llm(payload: ExtractInvoiceRequest) -> ExtractInvoice
 @app.post("/extract-llm", response_model=ExtractInvoiceResponse)
 async def extract_llm(payload: ExtractInvoiceRequest) -> ExtractInvoiceResponse:
     """Extract structured invoice fields from plain OCR text using an LLM."""
-    request_id = str(uuid.uuid4())[:8]
+    request_id = _reqid()
     logger.info("[%s] Extract-LLM for document %s", request_id, payload.documentId)
     response = await _extract_invoice_llm(payload)
-    logger.info("[%s] Extract-LLM completed for %s (issues=%d)", request_id, payload.documentId, len(response.validation.issues))
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("[%s] Extract-LLM completed for %s (issues=%d)", request_id, payload.documentId, len(response.validation.issues))
     return response
 
 
@@ -168,7 +510,7 @@ async def extract_vision(file: UploadFile = File(...)) -> VisionExtractResponse:
     Extract structured invoice fields by sending the uploaded image or PDF
     directly to the OpenAI vision API. Returns requiredFields + additionalFields.
     """
-    request_id = str(uuid.uuid4())[:8]
+    request_id = _reqid()
     if not os.environ.get("OPENAI_API_KEY"):
         raise HTTPException(
             status_code=503,
@@ -176,31 +518,38 @@ async def extract_vision(file: UploadFile = File(...)) -> VisionExtractResponse:
         )
     if not file.filename:
         raise HTTPException(status_code=422, detail="No file provided")
-    if not _is_allowed_file(file.filename, file.content_type):
+    ext = _get_file_extension(file.filename)
+    if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
             detail="Unsupported file type. Allowed: PDF, PNG, JPG",
         )
-    content = await file.read()
-    if not content:
+    _check_upload_size(file)
+    content, spool_path = await _materialize_upload(file, ext)
+    if not content and spool_path is None:
         raise HTTPException(status_code=400, detail="Empty file")
+    source = content if spool_path is None else spool_path
 
-    ext = _get_file_extension(file.filename)
     images: list[Image.Image] = []
 
     try:
         if ext == ".pdf":
-            images = pdf_to_images(content)
-            logger.info("[%s] Extract-vision: PDF converted to %d pages", request_id, len(images))
+            # As in _ocr_document: PyMuPDF holds the GIL while rasterizing, so heavy
+            # pages rendered in-process stall the loop despite the worker thread
+            images = await asyncio.to_thread(pdf_to_images, source)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[%s] Extract-vision: PDF converted to %d pages", request_id, len(images))
         else:
-            img = Image.open(io.BytesIO(content))
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            images = [img]
+            # The vision encoder downscales to VISION_MAX_DIM anyway
+            images = [_open_rgb(source, max_dim=VISION_MAX_DIM)]
             logger.info("[%s] Extract-vision: image upload", request_id)
     except (ValueError, RuntimeError, OSError) as e:
         logger.exception("[%s] File conversion failed: %s", request_id, e)
         raise HTTPException(status_code=500, detail="Failed to convert file to images") from e
+    finally:
+        # Pages are fully rendered / loaded at this point
+        if spool_path is not None:
+            os.unlink(spool_path)
 
     if not images:
         raise HTTPException(status_code=400, detail="No pages to process")
@@ -220,9 +569,10 @@ async def extract_vision(file: UploadFile = File(...)) -> VisionExtractResponse:
 @app.post("/extract-invoice", response_model=ExtractResponse)
 async def extract_rules(payload: ExtractRequest) -> ExtractResponse:
     """Extract structured invoice fields from OCR text using rule-based extraction only (no LLM). Bulgarian invoices."""
-    request_id = str(uuid.uuid4())[:8]
+    request_id = _reqid()
     ocr_text = payload.ocrText if payload.ocrText else "\n".join(payload.lines or [])
-    logger.info("[%s] Rule-based extract (len=%d)", request_id, len(ocr_text))
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("[%s] Rule-based extract (len=%d)", request_id, len(ocr_text))
     return extract_invoice_rules(ocr_text)
 
 
@@ -244,6 +594,9 @@ class InvoiceChatResponse(BaseModel):
     content: str
 
 
+# Invoice-chat answers for repeated questions; LLM_CACHE_SIZE=0 disables
+_chat_cache = LLMCache(int(os.environ.get("LLM_CACHE_SIZE", "256")))
+
 STARTER_SYSTEM_PROMPT = (
     "You are a professional accountant. Answer only questions about the provided invoice's data and basic accounting. "
     "Use only the extraction JSON you are given as context. "
@@ -260,6 +613,33 @@ PRO_ENTERPRISE_SYSTEM_PROMPT = (
     "Do NOT tell the user to consult another accountant—you are the accountant in this conversation."
 )
 
+# Unknown plans get the restricted starter prompt
+_SYSTEM_PROMPT_BY_PLAN = {
+    "starter": STARTER_SYSTEM_PROMPT,
+    "pro": PRO_ENTERPRISE_SYSTEM_PROMPT,
+    "enterprise": PRO_ENTERPRISE_SYSTEM_PROMPT,
+}
+
+
+def _render_context(extraction: dict[str, Any]) -> str:
+    """
+    Render the extraction JSON for the chat system message.
+
+    Compact and key-sorted, so the system message is byte-identical on every turn for
+    the same invoice (OpenAI's prompt-prefix cache can hit) and uses fewer tokens.
+
+    The orjson and stdlib outputs are not interchangeable: they format some floats
+    differently (1e16 vs 1e+16) and orjson writes NaN/Infinity as null. Each is
+    deterministic, but the prompt text and chat cache key depend on which is installed.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(extraction, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            # e.g. integers beyond 64 bits, which orjson rejects; stdlib handles them
+            pass
+    return json.dumps(extraction, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
 
 async def _invoice_chat_openai(
     extraction: dict[str, Any],
@@ -268,20 +648,15 @@ async def _invoice_chat_openai(
     plan: str,
 ) -> str:
     """Call OpenAI chat with a cheaper model; system prompt enforces accountant-only, invoice-only."""
-    from openai import OpenAI
-
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY is not set; cannot use invoice chat.")
     model = os.environ.get("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 
-    client = OpenAI(api_key=api_key)
-    context = json.dumps(extraction, ensure_ascii=False, indent=2)
-    plan_normalized = (plan or "starter").lower()
-    if plan_normalized == "pro" or plan_normalized == "enterprise":
-        system_prompt = PRO_ENTERPRISE_SYSTEM_PROMPT
-    else:
-        system_prompt = STARTER_SYSTEM_PROMPT
+    client = _get_chat_client(api_key)
+    context = _render_context(extraction)
+    system_prompt = _SYSTEM_PROMPT_BY_PLAN.get((plan or "starter").lower(), STARTER_SYSTEM_PROMPT)
+    # System message (instructions + invoice JSON) stays first, ahead of the history
     messages: list[dict[str, Any]] = [
         {"role": "system", "content": system_prompt + "\n\nExtracted invoice data (JSON):\n" + context},
     ]
@@ -290,16 +665,20 @@ async def _invoice_chat_openai(
             messages.append({"role": h.role, "content": h.content})
     messages.append({"role": "user", "content": message})
 
-    def _call() -> str:
-        response = client.chat.completions.create(
+    temperature = 0.3
+
+    async def _call() -> str:
+        response = await client.chat.completions.create(
             model=model,
             messages=messages,
-            temperature=0.3,
+            temperature=temperature,
             max_tokens=1024,
         )
         return (response.choices[0].message.content or "").strip()
 
-    return await asyncio.to_thread(_call)
+    # Same invoice + history + question (and plan, via the system prompt) -> same answer
+    cache_key = LLMCache.request_key(model, messages, temperature)
+    return await _chat_cache.get_or_set(cache_key, _call)
 
 
 @app.post("/invoice-chat", response_model=InvoiceChatResponse)
@@ -308,13 +687,14 @@ async def invoice_chat(payload: InvoiceChatRequest) -> InvoiceChatResponse:
     Answer a question about an invoice using extracted JSON as context.
     Uses a cheaper OpenAI model and a strict accountant-only system prompt.
     """
-    request_id = str(uuid.uuid4())[:8]
-    logger.info(
-        "[%s] Invoice-chat request (plan=%s, history=%d)",
-        request_id,
-        payload.plan,
-        len(payload.history),
-    )
+    request_id = _reqid()
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "[%s] Invoice-chat request (plan=%s, history=%d)",
+            request_id,
+            payload.plan,
+            len(payload.history),
+        )
     try:
         content = await _invoice_chat_openai(payload.extraction, payload.message, payload.history, payload.plan)
         logger.info("[%s] Invoice-chat completed", request_id)
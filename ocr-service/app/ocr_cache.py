@@ -0,0 +1,132 @@
+"""Optional disk cache of OCR page texts keyed by upload content hash."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Optional
+
+from app.ocr import OCR_GRAYSCALE, OCR_MAX_EDGE
+from app.pdf_utils import DEFAULT_DPI
+
+logger = logging.getLogger(__name__)
+
+_HASH_CHUNK = 1 << 20
+# prune() removes *.tmp files older than this (a crash or failed write left them behind)
+_STALE_TMP_SECONDS = 3600
+
+
+def _engine_version() -> str:
+    """Identify the OCR pipeline; entries from another engine/render setup never match."""
+    try:
+        paddle = metadata.version("paddleocr")
+    except metadata.PackageNotFoundError:
+        paddle = "unknown"
+    color = "gray" if OCR_GRAYSCALE else "rgb"
+    return f"paddleocr{paddle}-dpi{DEFAULT_DPI}-edge{OCR_MAX_EDGE}-{color}"
+
+
+class OCRCache:
+    """
+    One JSON file of page texts per distinct upload, under a directory.
+
+    Only page texts are stored; callers mint a fresh documentId per response. The
+    directory is pruned to max_entries (oldest first, by mtime; hits refresh mtime)
+    when prune() is called. directory=None disables the cache.
+    """
+
+    def __init__(self, directory: Optional[str], max_entries: int) -> None:
+        self._dir = Path(directory) if directory else None
+        self._max_entries = max_entries
+        self._version = _engine_version()
+        if self._dir is not None:
+            self._dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self._dir is not None
+
+    def key(self, source: bytes | str) -> str:
+        """SHA-256 of the upload (bytes, or a file path read in chunks)."""
+        h = hashlib.sha256()
+        if isinstance(source, bytes):
+            h.update(source)
+        else:
+            with open(source, "rb") as f:
+                while chunk := f.read(_HASH_CHUNK):
+                    h.update(chunk)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        assert self._dir is not None
+        return self._dir / f"{key}.{self._version}.json"
+
+    def get(self, key: str) -> Optional[list[str]]:
+        """Return cached page texts for key, or None on miss or unreadable entry."""
+        if self._dir is None:
+            return None
+        path = self._path(key)
+        try:
+            texts = json.loads(path.read_bytes())
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable OCR cache entry %s", path.name)
+            return None
+        logger.debug("OCR cache hit %s", key[:12])
+        return texts
+
+    def set(self, key: str, texts: list[str]) -> None:
+        """Store page texts under key; written atomically so readers never see partial files."""
+        if self._dir is None:
+            return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self._dir, suffix=".tmp")
+        except OSError:
+            logger.warning("Failed to write OCR cache entry", exc_info=True)
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(texts, ensure_ascii=False).encode("utf-8"))
+            os.replace(tmp, self._path(key))
+        except (OSError, TypeError, ValueError):
+            logger.warning("Failed to write OCR cache entry", exc_info=True)
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+
+    def prune(self) -> None:
+        """Delete the oldest entries beyond max_entries, and temp files left by failed writes."""
+        if self._dir is None:
+            return
+        entries = []
+        stale_before = time.time() - _STALE_TMP_SECONDS
+        for entry in os.scandir(self._dir):
+            if entry.name.endswith(".tmp"):
+                # Old enough that no set() can still be writing it
+                try:
+                    if entry.stat().st_mtime < stale_before:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+            elif entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        excess = len(entries) - self._max_entries
+        if self._max_entries <= 0 or excess <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        logger.info("Pruned %d OCR cache entries", excess)
@@ -1,44 +1,206 @@
-"""Convert PDF documents to PIL Images for OCR processing."""
+"""Render PDF documents to PIL Images or NumPy arrays for OCR processing."""
 
 import logging
-from typing import TYPE_CHECKING
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
 
-from pdf2image import convert_from_bytes
-from pdf2image.exceptions import PDFInfoNotInstalledError
-
-if TYPE_CHECKING:
-    from PIL import Image
+import numpy as np
+import pymupdf
+from PIL import Image
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_DPI = 200
 
+# Worker processes for rendering multi-page PDFs; 1 renders in the calling thread
+PDF_RENDER_WORKERS = max(1, int(os.environ.get("PDF_RENDER_WORKERS", "1")))
+
+# Pages lighter than this (page 1 is timed) render faster in-process than through the
+# pool, whose cost is mostly pickling the rendered array back (~30 ms for A4 RGB)
+_POOL_MIN_RENDER_SECONDS = 0.05
+
+_render_pool: ProcessPoolExecutor | None = None
+_render_pool_lock = threading.Lock()
+
 
-def pdf_to_images(pdf_bytes: bytes, dpi: int = DEFAULT_DPI) -> list["Image.Image"]:
+def _open_pdf(pdf: bytes | str) -> "pymupdf.Document":
+    """Open a PDF from bytes or a path; errors become ValueError."""
+    try:
+        if isinstance(pdf, bytes):
+            return pymupdf.open(stream=pdf, filetype="pdf")
+        return pymupdf.open(filename=pdf, filetype="pdf")
+    except Exception as e:
+        logger.exception("Failed to open PDF")
+        raise ValueError(f"Invalid or corrupted PDF: {e}") from e
+
+
+def _render_page(page: "pymupdf.Page", dpi: int, grayscale: bool = False) -> np.ndarray:
+    """
+    Render one page to a uint8 array: (H, W, 3) RGB, or (H, W) when grayscale.
+    Errors become ValueError.
+    """
+    try:
+        matrix = pymupdf.Matrix(dpi / 72, dpi / 72)
+        colorspace = pymupdf.csGRAY if grayscale else pymupdf.csRGB
+        pix = page.get_pixmap(matrix=matrix, colorspace=colorspace, alpha=False)
+    except Exception as e:
+        logger.exception("Failed to render PDF page %d", page.number + 1)
+        raise ValueError(f"Invalid or corrupted PDF: {e}") from e
+    # samples_mv views the pixmap's own memory, which is freed with pix, so the pixels
+    # are copied out exactly once (pix.samples would build an intermediate bytes copy)
+    rows = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    pixels = rows[:, : pix.width * pix.n].copy()
+    if pix.n == 1:
+        return pixels
+    return pixels.reshape(pix.height, pix.width, pix.n)
+
+
+# Worker-process state: the document the last task opened, keyed by a per-iteration token,
+# so a worker parses each PDF once rather than once per page
+_worker_doc: tuple[str, "pymupdf.Document"] | None = None
+
+
+def _render_page_in_worker(path: str, token: str, index: int, dpi: int, grayscale: bool) -> np.ndarray:
+    """Render-pool entry point: render one page, reusing this worker's open document."""
+    global _worker_doc
+    if _worker_doc is None or _worker_doc[0] != token:
+        if _worker_doc is not None:
+            _worker_doc[1].close()
+        _worker_doc = (token, _open_pdf(path))
+    return _render_page(_worker_doc[1][index], dpi, grayscale)
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn, not fork: the server process has OCR and event-loop threads running
+            _render_pool = ProcessPoolExecutor(
+                max_workers=PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _render_pool
+
+
+def warm_render_pool() -> None:
+    """Start the render worker processes now (no-op when PDF_RENDER_WORKERS is 1)."""
+    if PDF_RENDER_WORKERS > 1:
+        pool = _get_render_pool()
+        for future in [pool.submit(int) for _ in range(PDF_RENDER_WORKERS)]:
+            future.result()
+
+
+def _iter_arrays_parallel(
+    pdf: bytes | str, first: int, page_count: int, dpi: int, grayscale: bool
+) -> Iterator[np.ndarray]:
+    """Render pages first.. in the process pool, at most PDF_RENDER_WORKERS ahead of the consumer."""
+    pool = _get_render_pool()
+    tmp_path = None
+    if isinstance(pdf, bytes):
+        # Workers get a path, not the upload: pickling the bytes per task costs more
+        # than rendering a page
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf)
+    path = tmp_path or pdf
+    token = uuid.uuid4().hex
+    pending: deque[Future[np.ndarray]] = deque()
+    next_index = first
+    try:
+        while pending or next_index < page_count:
+            while next_index < page_count and len(pending) < PDF_RENDER_WORKERS:
+                pending.append(
+                    pool.submit(_render_page_in_worker, path, token, next_index, dpi, grayscale)
+                )
+                next_index += 1
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if tmp_path is not None:
+            # Workers may still hold it open; on POSIX that is fine after unlink
+            os.unlink(tmp_path)
+
+
+def iter_pdf_arrays(
+    pdf: bytes | str, dpi: int = DEFAULT_DPI, grayscale: bool = False
+) -> Iterator[np.ndarray]:
+    """
+    Render a PDF document page by page, yielding one (H, W, 3) uint8 RGB array per page.
+
+    Pages are rendered with PyMuPDF and the pixels copied once from the pixmap into
+    the array, skipping the PIL image and the extra copies Image.frombytes and
+    np.asarray(image) make. The generator itself holds only the page being rendered
+    (or, in the render pool, a window of PDF_RENDER_WORKERS pages).
+
+    PyMuPDF holds the GIL while rasterizing, so in-process rendering blocks every other
+    Python thread (including an asyncio loop) for the duration of each page, even when
+    this generator runs in a worker thread. With PDF_RENDER_WORKERS > 1, page 1 is still
+    rendered here; only when it took at least _POOL_MIN_RENDER_SECONDS are the remaining
+    pages sent to the process pool, since light pages render faster than the pool
+    returns their arrays.
+
+    Args:
+        pdf: Raw PDF file content as bytes, or a path to a PDF file on disk.
+        dpi: Resolution for rendering (default 200, balance of quality and speed).
+        grayscale: Render single-channel (H, W) arrays instead, a third of the memory.
+
+    Yields:
+        Arrays, one per page, in page order.
+
+    Raises:
+        ValueError: If PDF is invalid or cannot be converted.
+    """
+    with _open_pdf(pdf) as doc:
+        page_count = doc.page_count
+        for page in doc:
+            started = time.perf_counter()
+            array = _render_page(page, dpi, grayscale)
+            use_pool = (
+                page.number == 0
+                and PDF_RENDER_WORKERS > 1
+                and page_count > 2
+                and time.perf_counter() - started >= _POOL_MIN_RENDER_SECONDS
+            )
+            yield array
+            if use_pool:
+                break
+        else:
+            return
+    # PyMuPDF documents are not thread-safe, so each worker process opens its own
+    yield from _iter_arrays_parallel(pdf, 1, page_count, dpi, grayscale)
+
+
+def iter_pdf_images(pdf: bytes | str, dpi: int = DEFAULT_DPI) -> Iterator[Image.Image]:
+    """
+    Like iter_pdf_arrays, but yield each page as an RGB PIL Image.
+
+    Raises:
+        ValueError: If PDF is invalid or cannot be converted.
+    """
+    for array in iter_pdf_arrays(pdf, dpi=dpi):
+        yield Image.fromarray(array)
+
+
+def pdf_to_images(pdf: bytes | str, dpi: int = DEFAULT_DPI) -> list[Image.Image]:
     """
     Convert a PDF document to a list of PIL Images, one per page.
 
     Args:
-        pdf_bytes: Raw PDF file content as bytes.
+        pdf: Raw PDF file content as bytes, or a path to a PDF file on disk.
         dpi: Resolution for rendering (default 200, balance of quality and speed).
 
     Returns:
         List of PIL Image objects, one per page.
 
     Raises:
-        PDFInfoNotInstalledError: If poppler is not installed on the system.
         ValueError: If PDF is invalid or cannot be converted.
     """
-    try:
-        images = convert_from_bytes(pdf_bytes, dpi=dpi)
-    except PDFInfoNotInstalledError as e:
-        logger.error("Poppler is not installed. Install poppler-utils (apt-get install poppler-utils)")
-        raise RuntimeError(
-            "PDF conversion requires poppler. Install it: apt-get install poppler-utils (Linux), "
-            "brew install poppler (macOS), or use the poppler-windows release (Windows)."
-        ) from e
-    except Exception as e:
-        logger.exception("Failed to convert PDF to images")
-        raise ValueError(f"Invalid or corrupted PDF: {e}") from e
-
-    return list(images)
+    return list(iter_pdf_images(pdf, dpi=dpi))
@@ -20,50 +20,94 @@ CONF_REGEX_ONLY = 0.7
 CONF_INFERRED = 0.4
 CONF_NOT_FOUND = 0.0
 
+_FLAGS = re.IGNORECASE | re.DOTALL
+_WS_RE = re.compile(r"\s+")
+_DECIMAL_TRANS = str.maketrans({" ": None, ",": "."})
+
+
+def _keyword_line_pattern(keyword: str) -> re.Pattern[str]:
+    """Pattern for _keyword_line: keyword, then the first line after it as group 1."""
+    return re.compile(re.escape(keyword) + r"[:\s]*\n?\s*([^\n]+)", re.IGNORECASE)
+
+
+# Compiled once at import; extract_invoice_rules runs on every /extract-invoice request
+_INVOICE_NUMBER_RE = re.compile(r"(?:номер\s*(?:на\s*фактура)?[:\s]*)([0-9]+)", _FLAGS)
+_INVOICE_DATE_RE = re.compile(r"дата[:\s]*(\d{2}\.\d{2}\.\d{4})", _FLAGS)
+_SUPPLIER_LINE_RE = _keyword_line_pattern("доставчик")
+_ADDRESS_RE = re.compile(r"\bгр\.\s*[^\n]+")
+_EIK_RE = re.compile(r"еик[:\s]*([0-9]{9,13})", _FLAGS)
+_VAT_ID_RE = re.compile(r"ддс[:\s]*(bg[0-9]{9,13})", _FLAGS)
+_CLIENT_LINE_RE = _keyword_line_pattern("клиент")
+_SERVICE_RE = re.compile(r"услуга[:\s]*([^\n]+)", _FLAGS)
+_QTY_PRICE_RE = re.compile(r"(\d+)\s*бр\.?\s*.*?([\d.,]+)\s*лв")
+_ACCOUNT_RE = re.compile(r"счетоводна\s+сметка[:\s]*(\d+)", _FLAGS)
+_SUBTOTAL_RE = re.compile(r"данъчна\s+основа[:\s]*([\d.,]+)\s*лв", _FLAGS)
+_VAT_AMOUNT_RE = re.compile(r"ддс[:\s]*([\d.,]+)\s*лв", _FLAGS)
+_TOTAL_RE = re.compile(r"всичко[:\s]*([\d.,]+)\s*лв", _FLAGS)
+
 
 def normalize_text(text: str) -> str:
     """Lowercase and normalize whitespace per line; newlines preserved for structure."""
     if not text:
         return ""
     lines = text.split("\n")
-    normalized = [re.sub(r"\s+", " ", line.strip()).strip() for line in lines]
-    return "\n".join(normalized).lower()
+    normalized = "\n".join([_WS_RE.sub(" ", line.strip()).strip() for line in lines])
+    # islower() is a single C scan with no allocation; when it holds, lower() would
+    # return an identical copy, which is common for OCR text without capitals
+    return normalized if normalized.islower() else normalized.lower()
 
 
 def _parse_decimal(s: Optional[str]) -> Optional[float]:
     """Parse Bulgarian-style number (comma or dot as decimal separator). Returns None on failure."""
-    if s is None or not s.strip():
+    if not s:
         return None
-    s = s.strip().replace(" ", "").replace(",", ".")
+    # One C-level pass drops spaces and maps comma to dot; float() itself ignores
+    # surrounding whitespace and rejects blank input
     try:
-        return float(s)
+        return float(s.translate(_DECIMAL_TRANS))
     except ValueError:
         return None
 
 
-def _first_match(pattern: str, text: str, group: int = 1) -> tuple[Optional[str], float]:
-    """Return (capture group, confidence). Confidence CONF_REGEX_ONLY for regex-only match."""
-    m = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+def _first_match(
+    pattern: re.Pattern[str], text: str, group: int = 1, marker: Optional[str] = None
+) -> tuple[Optional[str], float]:
+    """Return (capture group, confidence). Confidence CONF_REGEX_ONLY for regex-only match.
+
+    marker: literal the pattern cannot match without; when absent the regex is skipped.
+    """
+    if marker is not None and marker not in text:
+        return (None, CONF_NOT_FOUND)
+    m = pattern.search(text)
     if m and m.lastindex >= group:
         return (m.group(group).strip(), CONF_REGEX_ONLY)
     return (None, CONF_NOT_FOUND)
 
 
-def _last_match(pattern: str, text: str, group: int = 1) -> tuple[Optional[str], float]:
-    """Return (last capture group, confidence)."""
-    matches = list(re.finditer(pattern, text, re.IGNORECASE | re.DOTALL))
-    if not matches:
+def _last_match(
+    pattern: re.Pattern[str], text: str, group: int = 1, marker: Optional[str] = None
+) -> tuple[Optional[str], float]:
+    """Return (last capture group, confidence). marker as for _first_match."""
+    if marker is not None and marker not in text:
+        return (None, CONF_NOT_FOUND)
+    m = None
+    for m in pattern.finditer(text):
+        pass
+    if m is None:
         return (None, CONF_NOT_FOUND)
-    m = matches[-1]
     if m.lastindex >= group:
         return (m.group(group).strip(), CONF_REGEX_ONLY)
     return (None, CONF_NOT_FOUND)
 
 
-def _keyword_line(keyword: str, text: str, next_line_as_value: bool = True) -> tuple[Optional[str], float]:
-    """Find keyword and return first line after it as value (e.g. Доставчик -> first line). CONF_KEYWORD_REGEX."""
-    pattern = re.escape(keyword) + r"[:\s]*\n?\s*([^\n]+)"
-    m = re.search(pattern, text, re.IGNORECASE)
+def _keyword_line(pattern: re.Pattern[str], text: str, keyword: str) -> tuple[Optional[str], float]:
+    """Find keyword and return first line after it as value (e.g. Доставчик -> first line). CONF_KEYWORD_REGEX.
+
+    pattern comes from _keyword_line_pattern(keyword).
+    """
+    if keyword not in text:
+        return (None, CONF_NOT_FOUND)
+    m = pattern.search(text)
     if m:
         return (m.group(1).strip(), CONF_KEYWORD_REGEX)
     return (None, CONF_NOT_FOUND)
@@ -81,14 +125,14 @@ def extract_invoice_rules(ocr_text: str) -> ExtractResponse:
 
 
 def _empty_response() -> ExtractResponse:
-    return ExtractResponse(
+    return ExtractResponse.model_construct(
         invoiceNumber=None,
         invoiceDate=None,
-        supplier=RuleSupplier(),
-        client=RuleClient(),
-        service=RuleService(),
+        supplier=RuleSupplier.model_construct(),
+        client=RuleClient.model_construct(),
+        service=RuleService.model_construct(),
         accountingAccount=None,
-        amounts=RuleAmounts(),
+        amounts=RuleAmounts.model_construct(),
         confidenceScores={},
     )
 
@@ -101,57 +145,58 @@ def _extract_invoice_rules_impl(ocr_text: str) -> ExtractResponse:
 
     scores: dict[str, float] = {}
 
+    # text is lowercased, so a plain substring test (done in C) rules out
+    # each keyword-anchored regex before any regex bytecode runs
+    has_lv = "лв" in text
+
     # Invoice number: (номер\s*(на\s*фактура)?[:\s]*)([0-9]+)
-    inv_num, c1 = _first_match(r"(?:номер\s*(?:на\s*фактура)?[:\s]*)([0-9]+)", text)
+    inv_num, c1 = _first_match(_INVOICE_NUMBER_RE, text, marker="номер")
     scores["invoiceNumber"] = c1
 
     # Invoice date: (дата[:\s]*)(\d{2}\.\d{2}\.\d{4})
-    inv_date, c2 = _first_match(r"дата[:\s]*(\d{2}\.\d{2}\.\d{4})", text)
+    inv_date, c2 = _first_match(_INVOICE_DATE_RE, text, marker="дата")
     scores["invoiceDate"] = c2
 
     # Supplier: Доставчик – first line
-    supplier_name, c_sn = _keyword_line("доставчик", text)
-    if supplier_name is None:
-        supplier_name, c_sn = _first_match(r"доставчик[:\s]*([^\n]+)", text)
+    # (A "доставчик[:\s]*([^\n]+)" fallback could never match where this fails)
+    supplier_name, c_sn = _keyword_line(_SUPPLIER_LINE_RE, text, "доставчик")
     scores["supplier.name"] = c_sn
 
     # Address: line starting with "гр."
-    addr_m = re.search(r"\bгр\.\s*[^\n]+", text)
+    addr_m = _ADDRESS_RE.search(text) if "гр." in text else None
     supplier_address = addr_m.group(0).strip() if addr_m else None
     scores["supplier.address"] = CONF_KEYWORD_REGEX if supplier_address else CONF_NOT_FOUND
 
-    # Supplier EIK: ЕИК[:\s]*([0-9]{9,13}) – first occurrence
-    supplier_eik, c_eik = _first_match(r"еик[:\s]*([0-9]{9,13})", text)
-    scores["supplier.eik"] = c_eik
+    # EIK: ЕИК[:\s]*([0-9]{9,13}) – first occurrence is the supplier, second the client
+    eik_ids = [m.group(1).strip() for m in _EIK_RE.finditer(text)] if "еик" in text else []
+    supplier_eik = eik_ids[0] if eik_ids else None
+    scores["supplier.eik"] = CONF_REGEX_ONLY if supplier_eik else CONF_NOT_FOUND
 
-    # Supplier VAT: ДДС[:\s]*(BG[0-9]{9,13})
-    supplier_vat, c_sv = _first_match(r"ддс[:\s]*(bg[0-9]{9,13})", text)
-    if supplier_vat:
-        supplier_vat = supplier_vat.upper()
-    scores["supplier.vat"] = c_sv
+    # VAT id: ДДС[:\s]*(BG[0-9]{9,13}) – first occurrence is the supplier, optional second the client
+    vat_ids: list[str] = []
+    if "ддс" in text:
+        vat_ids = [m.group(1).strip().upper() for m in _VAT_ID_RE.finditer(text)]
+    supplier_vat = vat_ids[0] if vat_ids else None
+    scores["supplier.vat"] = CONF_REGEX_ONLY if supplier_vat else CONF_NOT_FOUND
 
     # Client: Клиент – first line
-    client_name, c_cn = _keyword_line("клиент", text)
-    if client_name is None:
-        client_name, c_cn = _first_match(r"клиент[:\s]*([^\n]+)", text)
+    client_name, c_cn = _keyword_line(_CLIENT_LINE_RE, text, "клиент")
     scores["client.name"] = c_cn
 
     # Client EIK: second ЕИК (after first we already used for supplier)
-    eik_matches = list(re.finditer(r"еик[:\s]*([0-9]{9,13})", text))
-    client_eik = eik_matches[1].group(1).strip() if len(eik_matches) >= 2 else None
+    client_eik = eik_ids[1] if len(eik_ids) >= 2 else None
     scores["client.eik"] = CONF_REGEX_ONLY if client_eik else CONF_NOT_FOUND
 
     # Client VAT: optional second BG...
-    vat_matches = list(re.finditer(r"ддс[:\s]*(bg[0-9]{9,13})", text, re.IGNORECASE))
-    client_vat = vat_matches[1].group(1).strip().upper() if len(vat_matches) >= 2 else None
+    client_vat = vat_ids[1] if len(vat_ids) >= 2 else None
     scores["client.vat"] = CONF_REGEX_ONLY if client_vat else CONF_NOT_FOUND
 
     # Service: Услуга[:\s]*(.+)
-    service_desc, c_sd = _first_match(r"услуга[:\s]*([^\n]+)", text)
+    service_desc, c_sd = _first_match(_SERVICE_RE, text, marker="услуга")
     scores["service.description"] = c_sd
 
     # Quantity × price: (\d+)\s*бр.*?([\d.,]+)\s*лв
-    qty_price_m = re.search(r"(\d+)\s*бр\.?\s*.*?([\d.,]+)\s*лв", text)
+    qty_price_m = _QTY_PRICE_RE.search(text) if has_lv and "бр" in text else None
     quantity = qty_price_m.group(1) + " бр." if qty_price_m else None
     unit_price_val = _parse_decimal(qty_price_m.group(2)) if qty_price_m else None
     scores["service.quantity"] = CONF_REGEX_ONLY if quantity else CONF_NOT_FOUND
@@ -162,50 +207,52 @@ def _extract_invoice_rules_impl(ocr_text: str) -> ExtractResponse:
     scores["service.total"] = CONF_REGEX_ONLY if service_total is not None else CONF_NOT_FOUND
 
     # Accounting account: Счетоводна\s+Сметка[:\s]*(\d+)
-    acc_account, c_acc = _first_match(r"счетоводна\s+сметка[:\s]*(\d+)", text)
+    acc_account, c_acc = _first_match(_ACCOUNT_RE, text, marker="счетоводна")
     scores["accountingAccount"] = c_acc
 
     # Subtotal: Данъчна\s+основа[:\s]*([\d.,]+)\s*лв
-    subtotal_s, c_sub = _first_match(r"данъчна\s+основа[:\s]*([\d.,]+)\s*лв", text)
+    subtotal_s, c_sub = _first_match(_SUBTOTAL_RE, text, marker="данъчна")
     subtotal = _parse_decimal(subtotal_s)
     scores["amounts.subtotal"] = c_sub if subtotal is not None else CONF_NOT_FOUND
 
     # VAT amount: ДДС[:\s]*([\d.,]+)\s*лв – use LAST match
-    vat_s, c_vat = _last_match(r"ддс[:\s]*([\d.,]+)\s*лв", text)
+    vat_s, c_vat = _last_match(_VAT_AMOUNT_RE, text, marker="ддс")
     vat_amount = _parse_decimal(vat_s)
     scores["amounts.vat"] = c_vat if vat_amount is not None else CONF_NOT_FOUND
 
     # Total: Всичко[:\s]*([\d.,]+)\s*лв
-    total_s, c_tot = _first_match(r"всичко[:\s]*([\d.,]+)\s*лв", text)
+    total_s, c_tot = _first_match(_TOTAL_RE, text, marker="всичко")
     total_amount = _parse_decimal(total_s)
     scores["amounts.total"] = c_tot if total_amount is not None else CONF_NOT_FOUND
 
     # Currency: BGN if "лв" present
-    currency = "BGN" if "лв" in text else None
+    currency = "BGN" if has_lv else None
     scores["amounts.currency"] = CONF_INFERRED if currency else CONF_NOT_FOUND
 
-    return ExtractResponse(
+    # Every value above is a str, float or None of the declared field type, so
+    # validation is skipped (pydantic would only re-check what was just built)
+    return ExtractResponse.model_construct(
         invoiceNumber=inv_num,
         invoiceDate=inv_date,
-        supplier=RuleSupplier(
+        supplier=RuleSupplier.model_construct(
             name=supplier_name,
             address=supplier_address,
             eik=supplier_eik,
             vat=supplier_vat,
         ),
-        client=RuleClient(
+        client=RuleClient.model_construct(
             name=client_name,
             eik=client_eik,
             vat=client_vat,
         ),
-        service=RuleService(
+        service=RuleService.model_construct(
             description=service_desc,
             quantity=quantity,
             unitPrice=unit_price_val,
             total=service_total,
         ),
         accountingAccount=acc_account,
-        amounts=RuleAmounts(
+        amounts=RuleAmounts.model_construct(
             subtotal=subtotal,
             vat=vat_amount,
             total=total_amount,
@@ -6,7 +6,12 @@ from app.schemas import InvoiceFields, InvoiceValidation
 logger = logging.getLogger(__name__)
 
 _TOLERANCE = 0.02  # allowed rounding difference in amounts
-_KNOWN_CURRENCIES = {"EUR", "USD", "GBP", "BGN"}
+_KNOWN_CURRENCIES = frozenset({"EUR", "USD", "GBP", "BGN"})
+
+# Issue messages other modules match on (see app.confidence)
+AMOUNT_MISMATCH_ISSUE = "netAmount + vatAmount does not equal totalAmount"
+INVOICE_NUMBER_MISSING = "Invoice number missing"
+SUPPLIER_NAME_MISSING = "Supplier name missing"
 
 
 def validate_invoice(fields: InvoiceFields) -> InvoiceValidation:
@@ -21,9 +26,7 @@ def validate_invoice(fields: InvoiceFields) -> InvoiceValidation:
     if net is not None and vat is not None and total is not None:
         diff = (net + vat) - total
         if abs(diff) > _TOLERANCE:
-            issues.append(
-                f"netAmount + vatAmount does not equal totalAmount (difference: {diff:.2f})"
-            )
+            issues.append(f"{AMOUNT_MISMATCH_ISSUE} (difference: {diff:.2f})")
 
         # 2) VAT rate sanity check (around 20%)
         if net > 0:
@@ -33,26 +36,28 @@ def validate_invoice(fields: InvoiceFields) -> InvoiceValidation:
 
     # 3) Invoice number presence
     if not fields.invoiceNumber:
-        issues.append("Invoice number missing")
+        issues.append(INVOICE_NUMBER_MISSING)
 
     # 4) Currency consistency
-    if fields.currency is not None:
-        code = fields.currency.upper()
-        if code not in _KNOWN_CURRENCIES:
-            issues.append(f"Unknown currency '{fields.currency}'")
+    # Extracted codes are normally upper-case already; upper() only runs when not
+    currency = fields.currency
+    if (
+        currency is not None
+        and currency not in _KNOWN_CURRENCIES
+        and currency.upper() not in _KNOWN_CURRENCIES
+    ):
+        issues.append(f"Unknown currency '{currency}'")
 
     # 5) Missing / suspicious key fields
     if not fields.supplierName:
-        issues.append("Supplier name missing")
-    if fields.totalAmount is None:
+        issues.append(SUPPLIER_NAME_MISSING)
+    if total is None:
         issues.append("Total amount missing")
     if fields.invoiceDate is None:
         issues.append("Invoice date missing")
 
-    is_consistent = len(issues) == 0
-
     if issues:
         logger.warning("Invoice validation issues: %s", issues)
 
-    return InvoiceValidation(isConsistent=is_consistent, issues=issues)
+    return InvoiceValidation(isConsistent=not issues, issues=issues)
 
@@ -0,0 +1,54 @@
+"""
+Shared test setup: a stub PaddleOCR engine, so tests run without Paddle or its models.
+
+The stub must be installed before app.ocr is imported; conftest is loaded first.
+"""
+
+import os
+import sys
+import types
+
+import numpy as np
+import pymupdf
+import pytest
+
+os.environ.setdefault("OCR_WARMUP", "0")
+os.environ.pop("OCR_CACHE_DIR", None)
+
+
+class StubPaddleOCR:
+    """Returns one 3.x-style dict result per image whose text is the image's "WxH"."""
+
+    def __init__(self, **kwargs: object) -> None:
+        pass
+
+    def ocr(self, img: np.ndarray) -> list[dict]:
+        height, width = img.shape[:2]
+        return [
+            {
+                "dt_polys": [np.array([[0, 0], [10, 0], [10, 10], [0, 10]])],
+                "rec_texts": [f"{width}x{height}"],
+                "rec_scores": [0.9],
+            }
+        ]
+
+    def predict(self, imgs: list[np.ndarray]) -> list[dict]:
+        return [self.ocr(img)[0] for img in imgs]
+
+
+_stub = types.ModuleType("paddleocr")
+_stub.PaddleOCR = StubPaddleOCR
+sys.modules["paddleocr"] = _stub
+
+
+@pytest.fixture
+def make_pdf():
+    """Build a PDF whose page i is (100 + 10 * i) points wide, so each page's OCR text differs."""
+
+    def _make(pages: int) -> bytes:
+        doc = pymupdf.open()
+        for i in range(pages):
+            doc.new_page(width=100 + 10 * i, height=120)
+        return doc.tobytes()
+
+    return _make
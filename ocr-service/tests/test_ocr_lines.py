@@ -0,0 +1,60 @@
+"""The NumPy line grouping in app.ocr must match the plain-Python segment path exactly."""
+
+import random
+
+import numpy as np
+import pytest
+
+from app import ocr
+
+
+def _python_text(result: dict) -> str:
+    """Reference: the segment-based path _result_to_text takes for malformed or tiny results."""
+    lines = ocr._result_dict_to_lines(result)
+    grouped = ocr._group_into_lines(ocr._sort_by_reading_order(lines))
+    return "\n".join(
+        ocr._normalize_whitespace(" ".join(ocr._segment_text(seg) for seg in line)) for line in grouped
+    )
+
+
+def _numpy_text(result: dict) -> str:
+    polys, texts = ocr._result_dict_parts(result)
+    boxes = ocr._box_arrays(polys)
+    assert boxes is not None
+    return ocr._texts_to_lines(texts, *boxes)
+
+
+def _random_result(rng: random.Random, n: int) -> dict:
+    """n boxes on a few jittered rows, with duplicate coordinates and occasional tall boxes."""
+    polys, texts = [], []
+    for i in range(n):
+        row = rng.randrange(max(1, n // 4))
+        x = float(rng.randrange(0, 400, 20))
+        y = row * 18.0 + rng.choice([0.0, 0.0, 1.5, -2.0, 4.0])
+        w = float(rng.randrange(10, 120))
+        h = rng.choice([12.0, 14.0, 14.0, 40.0])
+        polys.append(np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.float32))
+        texts.append(f"t{i}")
+    return {"dt_polys": polys, "rec_texts": texts, "rec_scores": [0.9] * n}
+
+
+@pytest.mark.parametrize(
+    "n",
+    [1, ocr._NUMPY_MIN_SEGMENTS - 1, ocr._NUMPY_MIN_SEGMENTS, ocr._NUMPY_MIN_SEGMENTS + 1, 40, 300],
+)
+def test_numpy_grouping_matches_python(n):
+    rng = random.Random(n)
+    for _ in range(200):
+        result = _random_result(rng, n)
+        expected = _python_text(result)
+        assert _numpy_text(result) == expected
+        # Whichever path the cutoff picks, the output is the same
+        assert ocr._result_to_text(result) == expected
+
+
+def test_malformed_boxes_fall_back_to_python_path():
+    rng = random.Random(1)
+    result = _random_result(rng, 20)
+    result["dt_polys"][3] = None
+    assert ocr._box_arrays(result["dt_polys"]) is None
+    assert ocr._result_to_text(result) == _python_text(result)
@@ -0,0 +1,115 @@
+"""/ocr and /ocr/stream against the stub engine: page order, mid-stream errors, cancel cleanup."""
+
+import asyncio
+import io
+import json
+import random
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.pdf_utils import iter_pdf_arrays
+
+
+def _expected_texts(pdf: bytes) -> list[str]:
+    return [f"{a.shape[1]}x{a.shape[0]}" for a in iter_pdf_arrays(pdf, grayscale=main.OCR_GRAYSCALE)]
+
+
+def _stream_lines(client: TestClient, pdf: bytes) -> list[dict]:
+    response = client.post("/ocr/stream", files={"file": ("doc.pdf", pdf, "application/pdf")})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+@pytest.fixture
+def client() -> TestClient:
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def shuffled_ocr(monkeypatch):
+    """Make page OCR finish in a random order (seeded) instead of render order."""
+    real_ocr_page = main._ocr_page
+    rng = random.Random(0)
+
+    async def _ocr_page(img):
+        await asyncio.sleep(rng.uniform(0, 0.02))
+        return await real_ocr_page(img)
+
+    monkeypatch.setattr(main, "_ocr_page", _ocr_page)
+
+
+def test_ocr_returns_pages_in_order(client, make_pdf):
+    pdf = make_pdf(7)
+    response = client.post("/ocr", files={"file": ("doc.pdf", pdf, "application/pdf")})
+    assert response.status_code == 200
+    pages = response.json()["pages"]
+    assert [p["page"] for p in pages] == list(range(1, 8))
+    assert [p["text"] for p in pages] == _expected_texts(pdf)
+
+
+def test_stream_pairs_each_page_with_its_text(client, make_pdf, shuffled_ocr):
+    pdf = make_pdf(9)
+    lines = _stream_lines(client, pdf)
+    assert set(lines[0]) == {"documentId"}
+    pages = lines[1:]
+    assert sorted(p["page"] for p in pages) == list(range(1, 10))
+    expected = _expected_texts(pdf)
+    assert all(p["text"] == expected[p["page"] - 1] for p in pages)
+
+
+def test_stream_reports_render_error_mid_stream(client, make_pdf, monkeypatch):
+    pdf = make_pdf(5)
+    closed = []
+
+    def failing_iter(source, **kwargs):
+        try:
+            for i, page in enumerate(iter_pdf_arrays(source, **kwargs)):
+                if i == 3:
+                    raise ValueError("Invalid or corrupted PDF: page 4")
+                yield page
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(main, "iter_pdf_arrays", failing_iter)
+    lines = _stream_lines(client, pdf)
+    assert lines[-1] == {"detail": "OCR processing failed", "documentId": lines[0]["documentId"]}
+    # Pages rendered before the failure may or may not have been emitted, but never page 4+
+    assert all(line["page"] <= 3 for line in lines[1:-1])
+    assert closed == [True]
+
+
+def test_stream_cleans_up_when_client_disconnects(make_pdf, monkeypatch):
+    pdf = make_pdf(12)
+    rendered = []
+    closed = []
+
+    def tracking_iter(source, **kwargs):
+        try:
+            for page in iter_pdf_arrays(source, **kwargs):
+                rendered.append(True)
+                yield page
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(main, "iter_pdf_arrays", tracking_iter)
+
+    async def run() -> None:
+        upload = UploadFile(file=io.BytesIO(pdf), filename="doc.pdf", size=len(pdf))
+        response = await main.ocr_extract_stream(upload)
+        body = response.body_iterator
+        assert "documentId" in json.loads(await body.__anext__())
+        assert "page" in json.loads(await body.__anext__())
+        await body.aclose()
+        # An in-flight render closes the iterator from its done callback
+        for _ in range(100):
+            if closed:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert closed == [True]
+    # Render-ahead is bounded, so a disconnect stops rendering well before the end
+    assert len(rendered) < 12